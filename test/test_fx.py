@@ -4,9 +4,14 @@ import operator
 import numbers
 import pickle
 import copy
+import os
+import subprocess
+import sys
+import tempfile
 from pathlib import Path
 from torch.fx import symbolic_trace, Proxy, Node, GraphModule, Tracer, Graph
 from torch.fx.experimental import GraphManipulation
+from torch.fx.experimental.subgraph_creation_example import split_module, split_module_cached
 
 from torch.fx.proxy import TraceError
 
@@ -694,6 +699,190 @@ class TestFX(JitTestCase):
             user_indexes = GraphManipulation.get_all_users_of(gm, i)
             assert user_indexes == expected_uses[i]
 
+    def test_split_module(self):
+        class MyModule(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.param = torch.nn.Parameter(torch.rand(3, 4))
+                self.linear = torch.nn.Linear(4, 5)
+
+            def forward(self, x, y):
+                z = self.linear(x + self.param).clamp(min=0.0, max=1.0)
+                w = self.linear(y).clamp(min=0.0, max=1.0)
+                return z + w
+
+        my_module = MyModule()
+        my_module_traced = symbolic_trace(my_module)
+
+        partition_counter = 0
+        NPARTITIONS = 3
+
+        def mod_partition(node: Node):
+            nonlocal partition_counter
+            partition = partition_counter % NPARTITIONS
+            partition_counter = (partition_counter + 1) % NPARTITIONS
+            return partition
+
+        split_graph = split_module(my_module_traced, my_module, mod_partition)
+        split_graph.graph.lint(split_graph)
+
+        x = torch.rand(3, 4)
+        y = torch.rand(3, 4)
+        self.assertEqual(my_module(x, y), split_graph(x, y))
+
+    def test_split_module_input_order(self):
+        class M(torch.nn.Module):
+            def forward(self, x, y):
+                a = x + 1
+                b = y + 2
+                return b * a
+
+        m = M()
+        traced = symbolic_trace(m)
+        split_graph = split_module(traced, m, lambda node: 1 if node.target is operator.mul else 0)
+
+        # submodule inputs are ordered by first use, regardless of hashing
+        a_node, b_node = [n for n in traced.graph.nodes if n.target is operator.add]
+        placeholders = [n.target for n in split_graph.submod_1.graph.nodes if n.op == 'placeholder']
+        self.assertEqual(placeholders, [b_node.name, a_node.name])
+
+        x = torch.rand(3)
+        y = torch.rand(3)
+        self.assertEqual(m(x, y), split_graph(x, y))
+
+    def test_split_module_reused_names(self):
+        class M(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.linear = torch.nn.Linear(3, 3)
+
+            def forward(self, x):
+                a = self.linear(x)
+                return self.linear(a) + a
+
+        m = M()
+        traced = symbolic_trace(m)
+        first_linear = next(n for n in traced.graph.nodes if n.op == 'call_module')
+
+        # the second submodule takes the first linear's result as an input, and must not
+        # give that input's name to its own call of the same module
+        split_graph = split_module(traced, m, lambda node: 0 if node is first_linear else 1)
+        split_graph.submod_1.graph.lint(split_graph.submod_1)
+
+        x = torch.rand(3)
+        self.assertEqual(m(x), split_graph(x))
+
+    def test_split_module_cycle(self):
+        class M(torch.nn.Module):
+            def forward(self, x):
+                a = x + 1
+                b = a * 2
+                return b + a, b - 1
+
+        def partition_by_op(node):
+            return {operator.add: 0, operator.mul: 1, operator.sub: 2}[node.target]
+
+        m = M()
+        traced = symbolic_trace(m)
+        # the adds go to partition 0 and the mul to partition 1, so each depends on the other.
+        # Partition 2 only depends on the cycle and is not reported as part of it
+        with self.assertRaisesRegex(RuntimeError, 'cycle exists between partitions 0, 1!'):
+            split_module(traced, m, partition_by_op)
+
+    def test_split_module_cached(self):
+        class M(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.linear = torch.nn.Linear(3, 3)
+
+            def forward(self, x, y):
+                a = self.linear(x)
+                b = y + 2
+                return b * a
+
+        def partition_by_op(node):
+            partition_by_op.calls += 1
+            return 1 if node.target is operator.mul else 0
+        partition_by_op.calls = 0
+
+        m = M()
+        traced = symbolic_trace(m)
+        x = torch.rand(3)
+        y = torch.rand(3)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            split_graph = split_module_cached(traced, m, partition_by_op, cache_dir, 'by_op_v1')
+            self.assertEqual(partition_by_op.calls, 3)
+            self.assertEqual(m(x, y), split_graph(x, y))
+
+            # the partition assignment is read back from the cache
+            cached_split_graph = split_module_cached(traced, m, partition_by_op, cache_dir, 'by_op_v1')
+            self.assertEqual(partition_by_op.calls, 3)
+            self.assertEqual(split_graph.code, cached_split_graph.code)
+            self.assertEqual(m(x, y), cached_split_graph(x, y))
+
+            # submodules still share parameters with the original module
+            self.assertIs(cached_split_graph.submod_0.linear.weight, m.linear.weight)
+
+            # a new cache_key, e.g. after changing the callback, misses the old entry
+            def partition_by_add(node):
+                partition_by_add.calls += 1
+                return 1 if node.target is operator.add else 0
+            partition_by_add.calls = 0
+
+            add_split_graph = split_module_cached(traced, m, partition_by_add, cache_dir, 'by_op_v2')
+            self.assertEqual(partition_by_add.calls, 3)
+            self.assertEqual(m(x, y), add_split_graph(x, y))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_split_module_cached_across_processes(self):
+        script = """\
+import operator
+import sys
+import torch
+from torch.fx import symbolic_trace
+from torch.fx.experimental.subgraph_creation_example import split_module_cached
+
+class M(torch.nn.Module):
+    def forward(self, x, y):
+        return (x + 1) * y
+
+def partition_by_op(node):
+    partition_by_op.calls += 1
+    return 1 if node.target is operator.mul else 0
+partition_by_op.calls = 0
+
+m = M()
+split_module_cached(symbolic_trace(m), m, partition_by_op, sys.argv[1], 'by_op_v1')
+print(partition_by_op.calls)
+"""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            calls = [subprocess.check_output([sys.executable, '-c', script, cache_dir]).decode().strip()
+                     for _ in range(2)]
+        # the second process reads the assignment written by the first one
+        self.assertEqual(calls, ['2', '0'])
+
+    def test_split_module_single_partition(self):
+        class M(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.linear = torch.nn.Linear(3, 3)
+
+            def forward(self, x, y):
+                return self.linear(x) * y
+
+        m = M()
+        traced = symbolic_trace(m)
+        split_graph = split_module(traced, m, lambda node: 0)
+        split_graph.graph.lint(split_graph)
+
+        # the only submodule runs the original graph
+        self.assertEqual([n.target for n in split_graph.graph.nodes if n.op == 'call_module'], ['submod_0'])
+        self.assertIs(split_graph.submod_0.graph, traced.graph)
+
+        x = torch.rand(3)
+        y = torch.rand(3)
+        self.assertEqual(m(x, y), split_graph(x, y))
+
     def test_copy_no_remap(self):
         traced = symbolic_trace(SimpleTest())
         g = traced.graph
@@ -0,0 +1,307 @@
+import hashlib
+import itertools
+import operator
+import os
+import torch
+from torch.fx.graph_module import GraphModule
+from torch.fx.symbolic_trace import symbolic_trace
+from torch.fx.node import Node
+from typing import Callable, List, Dict, Any
+
+# opcodes whose nodes stay in the base module rather than in a partition
+_BASE_MODULE_OPS = frozenset(('placeholder', 'get_attr'))
+# opcodes whose target names an attribute of the root module
+_ATTR_TARGET_OPS = frozenset(('call_module', 'get_attr'))
+
+class Partition:
+    __slots__ = ['name', 'nodes', 'inputs', 'outputs', 'deps_mask', 'dependents_mask',
+                 'graph', 'environment', 'targets']
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.nodes: List[Node] = []
+        # insertion-ordered dicts rather than sets, so that submodule signatures
+        # follow the order in which values are first used
+        self.inputs: Dict[Node, None] = {}
+        self.outputs: Dict[Node, None] = {}
+        # bitmasks over partition ids: bit j is set if this partition depends on
+        # (resp. is depended on by) the partition with id j
+        self.deps_mask: int = 0
+        self.dependents_mask: int = 0
+        self.graph : torch.fx.graph.Graph = torch.fx.graph.Graph()  # type: ignore
+        self.environment : Dict[Node, Node] = {}
+        self.targets : Dict[str, Any] = {}
+
+    def __repr__(self) -> str:
+        return f"name: {self.name},\n" \
+            f" nodes: {self.nodes},\n" \
+            f" inputs: {list(self.inputs)},\n" \
+            f" outputs: {list(self.outputs)},\n" \
+            f" partitions dependent on: {_mask_bits(self.deps_mask)},\n" \
+            f" partition dependents: {_mask_bits(self.dependents_mask)}"
+
+def _mask_bits(mask: int) -> List[int]:
+    """Return the indices of the set bits of `mask`, lowest first."""
+    bits : List[int] = []
+    while mask:
+        low = mask & -mask
+        bits.append(low.bit_length() - 1)
+        mask ^= low
+    return bits
+
+def _input_nodes(node: Node) -> List[Node]:
+    """Return the Nodes used by `node`'s args and kwargs, in order of first use."""
+    seen : Dict[Node, None] = {}
+    torch.fx.graph.map_arg((node.args, node.kwargs), seen.setdefault)
+    return list(seen)
+
+# Creates subgraphs out of main graph
+def split_module(
+    m: GraphModule,
+    root_m: torch.nn.Module,
+    split_callback: Callable[[Node], int],
+):
+    """
+    Split the graph of `m` into submodules according to `split_callback`, which
+    maps each non-placeholder, non-get_attr Node to a partition id. Returns a
+    GraphModule that calls one submodule per partition in topological order.
+    """
+    # partitions are numbered densely in order of first appearance
+    partitions: List[Partition] = []
+    id_of: Dict[int, int] = {}
+    # partition id of every node that was split off of the base module. Kept
+    # here rather than as an attribute on the nodes so `m`'s graph is left untouched
+    node_to_partition: Dict[Node, int] = {}
+
+    # Set up values to construct base module. base_mod_env maps nodes of the
+    # original graph to their values in the base graph
+    base_mod_env : Dict[Node, Node] = {}
+    base_mod_graph : torch.fx.graph.Graph = torch.fx.graph.Graph()
+    base_mod_attrs : Dict[str, Any] = {}
+
+    # attribute values of `root_m`, keyed by fully qualified target. Shared
+    # modules and parameters are looked up once no matter how many nodes use them
+    resolved_targets : Dict[str, Any] = {}
+
+    def resolve_target(target : str) -> Any:
+        if target in resolved_targets:
+            return resolved_targets[target]
+        attr_val = root_m
+        for atom in target.split('.'):
+            if not hasattr(attr_val, atom):
+                raise RuntimeError(f'Node target {target} not found!')
+            attr_val = getattr(attr_val, atom)
+        resolved_targets[target] = attr_val
+        return attr_val
+
+    def record_graph_output(def_node : Node):
+        def_id = node_to_partition.get(def_node)
+        if def_id is not None:
+            partitions[def_id].outputs[def_node] = None
+
+    # Single pass over the graph: seed the base module with placeholders and
+    # attributes, split the remaining nodes into partitions and record the
+    # values that flow between partitions
+    for node in m.graph.nodes:
+        # placeholders and parameters stay in the base module and are passed as
+        # inputs to the partitions that use them
+        if node.op in _BASE_MODULE_OPS:
+            if node.op == 'placeholder':
+                base_mod_env[node] = base_mod_graph.placeholder(node.target)
+            else:
+                base_mod_env[node] = base_mod_graph.get_attr(node.target)
+                base_mod_attrs[node.target] = resolve_target(node.target)
+            continue
+
+        split_id = split_callback(node)
+
+        # add node to partitions
+        partition_id = id_of.get(split_id)
+        if partition_id is None:
+            id_of[split_id] = partition_id = len(partitions)
+            partitions.append(Partition(str(split_id)))
+        partition = partitions[partition_id]
+
+        partition.nodes.append(node)
+        node_to_partition[node] = partition_id
+
+        # record values flowing into this partition from other partitions or the base module.
+        # This runs once per edge of the graph, so it is kept inline rather than in a helper
+        for def_node in _input_nodes(node):
+            def_id = node_to_partition.get(def_node)
+            if def_id != partition_id:
+                partition.inputs[def_node] = None
+                if def_id is not None:
+                    def_partition = partitions[def_id]
+                    def_partition.outputs[def_node] = None
+                    def_partition.dependents_mask |= 1 << partition_id
+                    partition.deps_mask |= 1 << def_id
+
+    # values returned from the graph are used outside of every partition
+    torch.fx.graph.map_arg(m.graph.result, record_graph_output)
+
+    # When every node lands in the same partition, that partition is the original graph,
+    # so wrap it as is instead of sorting partitions and rebuilding it node by node.
+    # As with `GraphModule.__copy__`, the submodule shares `m`'s Graph object, so
+    # edits to one graph are seen by the other. Variadic placeholders are excluded,
+    # since the base graph cannot re-splat them
+    graph_inputs = [n for n in base_mod_env if n.op == 'placeholder']
+    if len(partitions) == 1 and not any(n.target.startswith('*') for n in graph_inputs):  # type: ignore
+        submod_name = f'submod_{partitions[0].name}'
+        base_mod_graph = torch.fx.graph.Graph()
+        placeholders = tuple(base_mod_graph.placeholder(n.target) for n in graph_inputs)  # type: ignore
+        base_mod_graph.output(base_mod_graph.call_module(submod_name, placeholders))
+        return GraphModule({submod_name: GraphModule(root_m, m.graph)}, base_mod_graph)
+
+    # check partitions for circular dependencies and create topological partition ordering
+    ready = [i for i, partition in enumerate(partitions) if partition.deps_mask == 0]
+    sorted_partitions : List[int] = []
+    while ready:
+        root_id = ready.pop()
+        sorted_partitions.append(root_id)
+        for dependent_id in _mask_bits(partitions[root_id].dependents_mask):
+            dependent = partitions[dependent_id]
+            dependent.deps_mask &= ~(1 << root_id)
+            if dependent.deps_mask == 0:
+                ready.append(dependent_id)
+    if len(sorted_partitions) != len(partitions):
+        # Every partition left over still depends on another left-over partition,
+        # so following dependencies from any of them must run into a cycle
+        sorted_set = set(sorted_partitions)
+        position_on_path : Dict[int, int] = {}
+        i = next(i for i in range(len(partitions)) if i not in sorted_set)
+        while i not in position_on_path:
+            position_on_path[i] = len(position_on_path)
+            i = _mask_bits(partitions[i].deps_mask)[0]
+        cycle = list(position_on_path)[position_on_path[i]:]
+        raise RuntimeError(f"cycle exists between partitions {', '.join(partitions[i].name for i in cycle)}!")
+
+    # Build a submodule for each partition in topological order:
+    # 1) Add placeholders for the partition's inputs, ahead of any other node, so
+    #    the submodule's arguments follow `partition.inputs`, the order in which
+    #    the base graph passes them. Placeholders and nodes keep their names from
+    #    `m`, which are unique, so no node can shadow a submodule argument
+    # 2) Transform the partition's nodes, in their original order, and collect
+    #    targets for the partition's submodule
+    # 3) Finish off the submodule Graph by setting corresponding outputs and
+    #    construct its GraphModule
+    # 4) Construct the base graph by emitting a call to the submodule
+    for partition_id in sorted_partitions:
+        partition = partitions[partition_id]
+        environment = partition.environment
+
+        for input_node in partition.inputs:
+            environment[input_node] = partition.graph.create_node(
+                'placeholder', input_node.name, name=input_node.name)
+
+        for node in partition.nodes:
+            # swap out old graph nodes in kw/args with references to new nodes in this submodule,
+            # remapping args and kwargs together in a single walk
+            gathered_args, gathered_kwargs = torch.fx.graph.map_arg(  # type: ignore
+                (node.args, node.kwargs), environment.__getitem__)
+
+            if node.op not in _ATTR_TARGET_OPS:
+                target = node.target
+            else:
+                assert isinstance(node.target, str)
+                target = node.target.replace('.', '_')
+                partition.targets[target] = resolve_target(node.target)
+
+            assert isinstance(gathered_args, tuple)
+            assert isinstance(gathered_kwargs, dict)
+            environment[node] = partition.graph.create_node(op=node.op, target=target, args=gathered_args,
+                                                            kwargs=gathered_kwargs, name=node.name)
+
+        # Set correct output values
+        output_vals = tuple(environment[n] for n in partition.outputs)
+        partition.graph.output(output_vals[0] if len(output_vals) == 1 else output_vals)
+
+        # Construct GraphModule for this partition
+        submod_name = f'submod_{partition.name}'
+        base_mod_attrs[submod_name] = GraphModule(partition.targets, partition.graph)
+
+        # Emit call in base graph to this submodule
+        output_val = base_mod_graph.call_module(submod_name, tuple(base_mod_env[n] for n in partition.inputs))
+        if len(partition.outputs) > 1:
+            # Unpack multiple return values from submodule
+            for i, output_node in enumerate(partition.outputs):
+                base_mod_env[output_node] = base_mod_graph.call_function(operator.getitem, (output_val, i))
+        elif partition.outputs:
+            base_mod_env[next(iter(partition.outputs))] = output_val
+
+    base_mod_graph.output(torch.fx.graph.map_arg(m.graph.result, base_mod_env.__getitem__))
+
+    return GraphModule(base_mod_attrs, base_mod_graph)
+
+def split_module_cached(
+    m: GraphModule,
+    root_m: torch.nn.Module,
+    split_callback: Callable[[Node], int],
+    cache_dir: str,
+    cache_key: str,
+):
+    """
+    Same as `split_module`, but remembers the partition `split_callback` assigns to
+    each node in `cache_dir`, keyed by the generated code of `m` and `cache_key`.
+    On a hit `split_callback` is not invoked; `split_module` itself still runs in
+    full, so this only pays off when the callback is the expensive part. Only the
+    assignment is cached, not the resulting GraphModule, so the submodules keep
+    sharing parameters with `root_m`.
+
+    The callback itself is not part of the key: the caller must pass a different
+    `cache_key` whenever `split_callback`, or anything it reads, changes.
+    """
+    # `m.code` rather than `str(m.graph)`, since the latter embeds object addresses
+    key = hashlib.blake2b('||'.join([m.code, cache_key]).encode()).hexdigest()
+    path = os.path.join(cache_dir, key + '.pt')
+    if os.path.exists(path):
+        assignment : Dict[str, int] = torch.load(path)
+        return split_module(m, root_m, lambda node: assignment[node.name])
+
+    assignment = {}
+
+    def recording_callback(node: Node) -> int:
+        assignment[node.name] = split_id = split_callback(node)
+        return split_id
+
+    split_graph = split_module(m, root_m, recording_callback)
+
+    # write to a temporary file first so that concurrent readers never see a partial entry
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    torch.save(assignment, tmp_path)
+    os.replace(tmp_path, path)
+    return split_graph
+
+if __name__ == '__main__':
+    class MyModule(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.param = torch.nn.Parameter(torch.rand(3, 4))
+            self.linear = torch.nn.Linear(4, 5)
+
+        def forward(self, x, y):
+            z = self.linear(x + self.param).clamp(min=0.0, max=1.0)
+            w = self.linear(y).clamp(min=0.0, max=1.0)
+            return z + w
+
+    # symbolically trace model
+    my_module = MyModule()
+    my_module_traced = symbolic_trace(my_module)
+
+    # round-robin partitioning; the counter lives in the closure rather than
+    # in a module global so each callback starts from partition 0
+    def make_mod_partition(n: int) -> Callable[[Node], int]:
+        counter = itertools.count()
+
+        def mod_partition(node: Node) -> int:
+            return next(counter) % n
+        return mod_partition
+
+    # split module in module with submodules
+    module_with_submodules = split_module(my_module_traced, my_module, make_mod_partition(3))
+
+    x = torch.rand(3, 4)
+    y = torch.rand(3, 4)
+    print(module_with_submodules)
+    print(torch.allclose(my_module(x, y), module_with_submodules(x, y)))